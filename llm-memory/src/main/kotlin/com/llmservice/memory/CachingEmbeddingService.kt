@@ -0,0 +1,85 @@
+package com.llmservice.memory
+
+import java.security.MessageDigest
+import java.time.Instant
+import java.util.HexFormat
+
+/**
+ * 带缓存的嵌入服务
+ * 以文本的 SHA-256 摘要为键缓存嵌入结果，相同文本只调用一次底层服务
+ *
+ * @param delegate 实际生成嵌入的服务
+ * @param maxSize 最多缓存的条目数，超出时淘汰最久未使用的条目
+ * @param ttlSeconds 条目有效期（秒），0 表示永不过期
+ */
+class CachingEmbeddingService(
+    private val delegate: EmbeddingService,
+    private val maxSize: Int = 1000,
+    private val ttlSeconds: Long = 0
+) : EmbeddingService {
+
+    private class Entry(val embedding: List<Float>, val createdAt: Long)
+
+    private val cache = object : LinkedHashMap<String, Entry>(16, 0.75f, true) {
+        override fun removeEldestEntry(eldest: MutableMap.MutableEntry<String, Entry>?): Boolean {
+            return size > maxSize
+        }
+    }
+
+    override suspend fun generateEmbedding(text: String): List<Float> {
+        val key = digest(text)
+        lookup(key)?.let { return it }
+
+        val embedding = delegate.generateEmbedding(text)
+        store(key, embedding)
+        return embedding
+    }
+
+    override suspend fun generateBatchEmbeddings(texts: List<String>): List<List<Float>> {
+        val keys = texts.map { digest(it) }
+        val results = keys.map { lookup(it) }.toMutableList()
+        val missing = results.indices.filter { results[it] == null }
+
+        if (missing.isNotEmpty()) {
+            // 未命中的文本去重后通过一次批量调用生成
+            val missingTexts = missing.map { texts[it] }.distinct()
+            val generated = missingTexts.zip(delegate.generateBatchEmbeddings(missingTexts)).toMap()
+            missing.forEach { i ->
+                val embedding = generated[texts[i]] ?: emptyList()
+                results[i] = embedding
+                store(keys[i], embedding)
+            }
+        }
+
+        return results.map { it ?: emptyList() }
+    }
+
+    /**
+     * 清空缓存
+     */
+    fun clear() {
+        synchronized(cache) { cache.clear() }
+    }
+
+    private fun lookup(key: String): List<Float>? {
+        synchronized(cache) {
+            val entry = cache[key] ?: return null
+            if (ttlSeconds > 0 && Instant.now().epochSecond - entry.createdAt > ttlSeconds) {
+                cache.remove(key)
+                return null
+            }
+            return entry.embedding
+        }
+    }
+
+    private fun store(key: String, embedding: List<Float>) {
+        // 生成失败返回的空向量不缓存，下次仍会重试
+        if (embedding.isEmpty()) return
+        synchronized(cache) { cache[key] = Entry(embedding, Instant.now().epochSecond) }
+    }
+
+    private fun digest(text: String): String {
+        val bytes = MessageDigest.getInstance("SHA-256").digest(text.toByteArray(Charsets.UTF_8))
+        return HexFormat.of().formatHex(bytes)
+    }
+}
@@ -0,0 +1,391 @@
+package com.llmservice.memory
+
+import java.nio.channels.FileChannel
+import java.nio.file.Path
+import java.nio.file.StandardOpenOption
+import java.util.Arrays
+
+/**
+ * 嵌入向量在索引中的存储精度
+ */
+enum class EmbeddingPrecision {
+    FLOAT32,    // 原始单精度
+    INT8,       // 每行一个缩放系数的 8 位量化，内存占用约为 FLOAT32 的 1/4
+    FLOAT16     // IEEE 754 半精度，内存占用为 FLOAT32 的 1/2，无需缩放系数
+}
+
+/**
+ * 嵌入向量索引
+ * 将所有节点的向量按行连续存放，相似度扫描直接遍历该矩阵
+ * 每行在写入时归一化为单位向量，余弦相似度退化为与归一化查询向量的点积
+ *
+ * 新行原地追加；修改或删除已有行时，若上次复制后通过 [rows] 取得过快照，先复制一次底层数组，
+ * 因此快照在扫描期间不会被并发写入破坏，没有快照时则原地修改
+ */
+internal class EmbeddingIndex(val precision: EmbeddingPrecision = EmbeddingPrecision.FLOAT32) {
+
+    /**
+     * 索引在某一时刻的只读视图
+     */
+    class Rows(
+        private val precision: EmbeddingPrecision,
+        private val matrix: FloatArray,
+        private val quantized: ByteArray,
+        private val scales: FloatArray,
+        private val halves: ShortArray,
+        val ids: Array<String?>,
+        val count: Int,
+        val dimension: Int
+    ) {
+
+        /**
+         * 计算第 [row] 行与查询向量的余弦相似度
+         * [query] 须已通过 [normalize] 归一化
+         */
+        fun cosine(row: Int, query: FloatArray): Float {
+            val offset = row * dimension
+            var dotProduct = 0f
+            when (precision) {
+                EmbeddingPrecision.FLOAT32 -> {
+                    for (i in 0 until dimension) {
+                        dotProduct += matrix[offset + i] * query[i]
+                    }
+                }
+                EmbeddingPrecision.INT8 -> {
+                    for (i in 0 until dimension) {
+                        dotProduct += quantized[offset + i] * query[i]
+                    }
+                    dotProduct *= scales[row]
+                }
+                EmbeddingPrecision.FLOAT16 -> {
+                    for (i in 0 until dimension) {
+                        dotProduct += java.lang.Float.float16ToFloat(halves[offset + i]) * query[i]
+                    }
+                }
+            }
+            return dotProduct
+        }
+    }
+
+    private var matrix = FloatArray(0)
+    private var quantized = ByteArray(0)
+    private var scales = FloatArray(0)
+    private var halves = ShortArray(0)
+    private var ids = arrayOfNulls<String>(0)
+    private val rowOf = HashMap<String, Int>()
+    private var count = 0
+    private var dimension = 0
+
+    // 当前底层数组是否可能被 [rows] 返回的快照引用
+    private var shared = false
+
+    val size: Int
+        @Synchronized get() = count
+
+    @Synchronized
+    fun rows(): Rows {
+        shared = true
+        return view()
+    }
+
+    @Synchronized
+    fun contains(id: String): Boolean = rowOf.containsKey(id)
+
+    /**
+     * 按行顺序返回索引中所有节点编号
+     */
+    @Synchronized
+    fun ids(): List<String> = (0 until count).map { ids[it]!! }
+    
+    /**
+     * 只计算指定节点与查询向量的相似度，没有向量的节点被跳过
+     * [query] 须已通过 [normalize] 归一化
+     */
+    @Synchronized
+    fun score(ids: Collection<String>, query: FloatArray): List<Pair<String, Float>> {
+        if (query.size != dimension) return emptyList()
+        val rows = view()
+        return ids.mapNotNull { id -> rowOf[id]?.let { row -> id to rows.cosine(row, query) } }
+    }
+
+    /**
+     * 写入或更新节点向量
+     * 空向量或与索引维度不一致的向量被拒绝，该节点已有的行保持不变
+     */
+    @Synchronized
+    fun put(id: String, embedding: List<Float>): Boolean {
+        if (embedding.isEmpty()) return false
+        if (count == 0) dimension = embedding.size
+        if (embedding.size != dimension) return false
+
+        val normalized = normalize(embedding)
+        val existing = rowOf[id]
+        if (existing == null) {
+            ensureCapacity(count + 1)
+            writeRow(count, normalized)
+            ids[count] = id
+            rowOf[id] = count
+            count++
+        } else if (!rowEquals(existing, normalized)) {
+            detachFromSnapshots()
+            writeRow(existing, normalized)
+        }
+        return true
+    }
+
+    /**
+     * 批量写入节点向量，只扩容一次
+     *
+     * @return 与 [entries] 一一对应的写入结果，含义同 [put] 的返回值
+     */
+    @Synchronized
+    fun putAll(entries: List<Pair<String, List<Float>>>): List<Boolean> {
+        if (entries.isEmpty()) return emptyList()
+        if (count == 0) entries.firstOrNull { it.second.isNotEmpty() }?.let { dimension = it.second.size }
+        ensureCapacity(count + entries.size)
+        return entries.map { (id, embedding) -> put(id, embedding) }
+    }
+
+    /**
+     * 移除节点向量，用最后一行填补空位
+     */
+    @Synchronized
+    fun remove(id: String): Boolean = removeAll(listOf(id)) > 0
+
+    /**
+     * 批量移除节点向量，底层数组最多复制一次
+     * 按行号从大到小依次用最后一行填补空位，每移除一行只移动一行数据
+     *
+     * @return 实际移除的行数
+     */
+    @Synchronized
+    fun removeAll(nodeIds: Collection<String>): Int {
+        val removedRows = nodeIds.mapNotNull { rowOf.remove(it) }.sortedDescending()
+        if (removedRows.isEmpty()) return 0
+        detachFromSnapshots()
+
+        // 比当前行号大的待删行都已移除，最后一行要么就是当前行，要么是保留的行
+        removedRows.forEach { row ->
+            val last = count - 1
+            if (row != last) {
+                moveRow(last, row)
+                val movedId = ids[last]!!
+                ids[row] = movedId
+                rowOf[movedId] = row
+            }
+            ids[last] = null
+            count = last
+        }
+        return removedRows.size
+    }
+
+    /**
+     * 将索引写入文件：头部、连续的向量矩阵、按行顺序排列的节点编号
+     */
+    @Synchronized
+    fun save(path: Path) {
+        val idBytes = (0 until count).map { ids[it]!!.toByteArray(Charsets.UTF_8) }
+        val matrixBytes = when (precision) {
+            EmbeddingPrecision.FLOAT32 -> count.toLong() * dimension * Float.SIZE_BYTES
+            EmbeddingPrecision.INT8 -> count.toLong() * Float.SIZE_BYTES + count.toLong() * dimension
+            EmbeddingPrecision.FLOAT16 -> count.toLong() * dimension * Short.SIZE_BYTES
+        }
+        val size = HEADER_BYTES + matrixBytes + idBytes.sumOf { Int.SIZE_BYTES.toLong() + it.size }
+
+        FileChannel.open(
+            path,
+            StandardOpenOption.CREATE,
+            StandardOpenOption.TRUNCATE_EXISTING,
+            StandardOpenOption.READ,
+            StandardOpenOption.WRITE
+        ).use { channel ->
+            val buffer = channel.map(FileChannel.MapMode.READ_WRITE, 0, size)
+            buffer.putInt(MAGIC).putInt(precision.ordinal).putInt(dimension).putInt(count)
+            when (precision) {
+                EmbeddingPrecision.FLOAT32 -> {
+                    buffer.asFloatBuffer().put(matrix, 0, count * dimension)
+                    buffer.position(buffer.position() + count * dimension * Float.SIZE_BYTES)
+                }
+                EmbeddingPrecision.INT8 -> {
+                    buffer.asFloatBuffer().put(scales, 0, count)
+                    buffer.position(buffer.position() + count * Float.SIZE_BYTES)
+                    buffer.put(quantized, 0, count * dimension)
+                }
+                EmbeddingPrecision.FLOAT16 -> {
+                    buffer.asShortBuffer().put(halves, 0, count * dimension)
+                    buffer.position(buffer.position() + count * dimension * Short.SIZE_BYTES)
+                }
+            }
+            idBytes.forEach { bytes -> buffer.putInt(bytes.size).put(bytes) }
+            buffer.force()
+        }
+    }
+
+    private fun ensureCapacity(rows: Int) {
+        if (ids.size >= rows && storageRows() >= rows) return
+        val newRows = maxOf(rows, ids.size * 2, INITIAL_ROWS)
+        when (precision) {
+            EmbeddingPrecision.FLOAT32 -> matrix = matrix.copyOf(newRows * dimension)
+            EmbeddingPrecision.INT8 -> {
+                quantized = quantized.copyOf(newRows * dimension)
+                scales = scales.copyOf(newRows)
+            }
+            EmbeddingPrecision.FLOAT16 -> halves = halves.copyOf(newRows * dimension)
+        }
+        ids = ids.copyOf(newRows)
+        shared = false
+    }
+
+    private fun storageRows(): Int {
+        if (dimension == 0) return 0
+        return when (precision) {
+            EmbeddingPrecision.FLOAT32 -> matrix.size / dimension
+            EmbeddingPrecision.INT8 -> minOf(quantized.size / dimension, scales.size)
+            EmbeddingPrecision.FLOAT16 -> halves.size / dimension
+        }
+    }
+
+    private fun view(): Rows = Rows(precision, matrix, quantized, scales, halves, ids, count, dimension)
+
+    /**
+     * 修改已有行之前调用：底层数组可能被快照引用时先复制，之后的修改不再影响快照
+     */
+    private fun detachFromSnapshots() {
+        if (!shared) return
+        copyStorage()
+        ids = ids.copyOf()
+        shared = false
+    }
+
+    private fun copyStorage() {
+        when (precision) {
+            EmbeddingPrecision.FLOAT32 -> matrix = matrix.copyOf()
+            EmbeddingPrecision.INT8 -> {
+                quantized = quantized.copyOf()
+                scales = scales.copyOf()
+            }
+            EmbeddingPrecision.FLOAT16 -> halves = halves.copyOf()
+        }
+    }
+
+    private fun moveRow(from: Int, to: Int) {
+        when (precision) {
+            EmbeddingPrecision.FLOAT32 -> System.arraycopy(matrix, from * dimension, matrix, to * dimension, dimension)
+            EmbeddingPrecision.INT8 -> {
+                System.arraycopy(quantized, from * dimension, quantized, to * dimension, dimension)
+                scales[to] = scales[from]
+            }
+            EmbeddingPrecision.FLOAT16 -> System.arraycopy(halves, from * dimension, halves, to * dimension, dimension)
+        }
+    }
+
+    private fun writeRow(row: Int, normalized: FloatArray) {
+        when (precision) {
+            EmbeddingPrecision.FLOAT32 -> System.arraycopy(normalized, 0, matrix, row * dimension, dimension)
+            EmbeddingPrecision.INT8 -> scales[row] = quantize(normalized, quantized, row * dimension)
+            EmbeddingPrecision.FLOAT16 -> {
+                val offset = row * dimension
+                for (i in 0 until dimension) {
+                    halves[offset + i] = java.lang.Float.floatToFloat16(normalized[i])
+                }
+            }
+        }
+    }
+
+    private fun rowEquals(row: Int, normalized: FloatArray): Boolean {
+        val offset = row * dimension
+        return when (precision) {
+            EmbeddingPrecision.FLOAT32 -> Arrays.equals(matrix, offset, offset + dimension, normalized, 0, dimension)
+            EmbeddingPrecision.INT8 -> {
+                val bytes = ByteArray(dimension)
+                val scale = quantize(normalized, bytes, 0)
+                scale == scales[row] && Arrays.equals(quantized, offset, offset + dimension, bytes, 0, dimension)
+            }
+            EmbeddingPrecision.FLOAT16 -> (0 until dimension).all { i ->
+                halves[offset + i] == java.lang.Float.floatToFloat16(normalized[i])
+            }
+        }
+    }
+
+    companion object {
+        private const val MAGIC = 0x4B454D42 // "KEMB"
+        private const val HEADER_BYTES = 4 * Int.SIZE_BYTES
+        private const val INITIAL_ROWS = 64
+
+        /**
+         * 将向量归一化为单位向量，零向量保持为零
+         */
+        fun normalize(embedding: List<Float>): FloatArray {
+            val vector = embedding.toFloatArray()
+            var norm = 0f
+            for (value in vector) norm += value * value
+            norm = kotlin.math.sqrt(norm)
+            if (norm > 0f) {
+                for (i in vector.indices) vector[i] /= norm
+            }
+            return vector
+        }
+
+        /**
+         * 以对称线性量化把 [vector] 写入 [target] 的 [offset] 处，返回该行的缩放系数
+         */
+        private fun quantize(vector: FloatArray, target: ByteArray, offset: Int): Float {
+            var maxAbs = 0f
+            for (value in vector) maxAbs = maxOf(maxAbs, kotlin.math.abs(value))
+            if (maxAbs == 0f) {
+                target.fill(0, offset, offset + vector.size)
+                return 0f
+            }
+
+            val scale = maxAbs / 127f
+            for (i in vector.indices) {
+                target[offset + i] = kotlin.math.round(vector[i] / scale).toInt().coerceIn(-127, 127).toByte()
+            }
+            return scale
+        }
+
+        /**
+         * 通过内存映射读取 [save] 写出的索引文件
+         * 向量矩阵以一次批量复制从映射区读入，无需逐个解码
+         */
+        fun load(path: Path): EmbeddingIndex {
+            FileChannel.open(path, StandardOpenOption.READ).use { channel ->
+                val buffer = channel.map(FileChannel.MapMode.READ_ONLY, 0, channel.size())
+                require(buffer.getInt() == MAGIC) { "Not an embedding index file: $path" }
+
+                val index = EmbeddingIndex(EmbeddingPrecision.entries[buffer.getInt()])
+                index.dimension = buffer.getInt()
+                index.count = buffer.getInt()
+                when (index.precision) {
+                    EmbeddingPrecision.FLOAT32 -> {
+                        index.matrix = FloatArray(index.count * index.dimension)
+                        buffer.asFloatBuffer().get(index.matrix)
+                        buffer.position(buffer.position() + index.matrix.size * Float.SIZE_BYTES)
+                    }
+                    EmbeddingPrecision.INT8 -> {
+                        index.scales = FloatArray(index.count)
+                        buffer.asFloatBuffer().get(index.scales)
+                        buffer.position(buffer.position() + index.scales.size * Float.SIZE_BYTES)
+                        index.quantized = ByteArray(index.count * index.dimension)
+                        buffer.get(index.quantized)
+                    }
+                    EmbeddingPrecision.FLOAT16 -> {
+                        index.halves = ShortArray(index.count * index.dimension)
+                        buffer.asShortBuffer().get(index.halves)
+                        buffer.position(buffer.position() + index.halves.size * Short.SIZE_BYTES)
+                    }
+                }
+
+                index.ids = arrayOfNulls(index.count)
+                for (row in 0 until index.count) {
+                    val bytes = ByteArray(buffer.getInt())
+                    buffer.get(bytes)
+                    val id = String(bytes, Charsets.UTF_8)
+                    index.ids[row] = id
+                    index.rowOf[id] = row
+                }
+                return index
+            }
+        }
+    }
+}
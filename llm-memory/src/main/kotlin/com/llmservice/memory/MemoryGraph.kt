@@ -1,43 +1,128 @@
 package com.llmservice.memory
 
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.async
+import kotlinx.coroutines.awaitAll
+import kotlinx.coroutines.coroutineScope
 import kotlinx.coroutines.flow.Flow
 import kotlinx.coroutines.flow.flow
+import kotlinx.coroutines.withContext
 import org.jgrapht.Graph
 import org.jgrapht.graph.DefaultDirectedWeightedGraph
 import org.jgrapht.graph.DefaultWeightedEdge
+import java.nio.file.Path
+import java.time.Instant
+import java.util.PriorityQueue
 import java.util.concurrent.ConcurrentHashMap
+import java.util.concurrent.atomic.AtomicInteger
+import java.util.concurrent.atomic.AtomicLong
+import kotlin.math.ln
 
 /**
  * 记忆图：管理记忆节点和它们之间的关系
  * 使用图结构来表示和操作记忆网络
+ *
+ * @param scanParallelism 单次相似度检索最多拆分的并行任务数。
+ * 调用方已在多个协程中并发检索时可设为 1，避免每个查询再各自占满所有核心
+ * @param embeddingPrecision 索引中向量的存储精度，节点较多时可选 FLOAT16 或 INT8 以降低内存占用
  */
-class MemoryGraph {
+class MemoryGraph(
+    private val scanParallelism: Int = DEFAULT_SCAN_PARALLELISM,
+    private val embeddingPrecision: EmbeddingPrecision = EmbeddingPrecision.FLOAT32
+) {
     
     private val nodes = ConcurrentHashMap<String, MemoryNode>()
     private val relations = ConcurrentHashMap<String, MemoryRelation>()
     private val graph: Graph<String, DefaultWeightedEdge> = DefaultDirectedWeightedGraph(DefaultWeightedEdge::class.java)
     
+    // 所有节点的嵌入向量按行连续存放，相似度检索直接扫描该矩阵
+    @Volatile
+    private var embeddingIndex = EmbeddingIndex(embeddingPrecision)
+    
+    // 词项 -> 整数编号，只增不减；节点的词项集合在写入时预先计算为有序编号数组
+    private val tokenIds = ConcurrentHashMap<String, Int>()
+    private val nextTokenId = AtomicInteger()
+    private val nodeTokens = ConcurrentHashMap<String, IntArray>()
+    
+    // 词项编号 -> 含有该词项的节点编号，关键词检索只需访问命中查询词的节点
+    private val tokenPostings = ConcurrentHashMap<Int, MutableSet<String>>()
+    private val totalTokenCount = AtomicLong()
+    
+    // 标签 -> 带有该标签的节点编号，按标签过滤时可只对候选节点计算相似度
+    private val tagIndex = ConcurrentHashMap<String, MutableSet<String>>()
+    
+    private val modificationCount = AtomicLong()
+    private val accessCount = AtomicLong()
+    
+    /**
+     * 图内容的版本号，节点、关系或向量发生变化时递增
+     * 仅访问节点（更新访问统计）不会改变版本号，可用于判断基于检索结果的缓存是否失效
+     */
+    val version: Long
+        get() = modificationCount.get()
+    
+    /**
+     * 节点访问统计的版本号，每次通过 [getNode] 访问节点时递增
+     * 与 [version] 一起可判断依赖重要性排名的结果（如统计信息）是否失效
+     */
+    val accessVersion: Long
+        get() = accessCount.get()
+    
     /**
      * 添加记忆节点
      */
     suspend fun addNode(node: MemoryNode): Boolean {
         return if (nodes.putIfAbsent(node.id, node) == null) {
             graph.addVertex(node.id)
+            // 不带向量的节点不进入索引，可稍后通过 updateEmbeddings 或 loadEmbeddings 补全
+            if (node.embedding.isNotEmpty()) {
+                embeddingIndex.put(node.id, node.embedding)
+            }
+            indexTokens(node.id, internTokens(node))
+            indexTags(node)
+            modificationCount.incrementAndGet()
             true
         } else {
             false
         }
     }
     
+    /**
+     * 批量添加记忆节点，已存在的节点会被跳过
+     * 新节点的向量一次性写入索引
+     *
+     * @return 与 [newNodes] 一一对应的添加结果，含义同 [addNode] 的返回值
+     */
+    suspend fun addNodes(newNodes: Collection<MemoryNode>): List<Boolean> {
+        val results = newNodes.map { nodes.putIfAbsent(it.id, it) == null }
+        val added = newNodes.filterIndexed { i, _ -> results[i] }
+        added.forEach { node ->
+            graph.addVertex(node.id)
+            indexTokens(node.id, internTokens(node))
+            indexTags(node)
+        }
+        embeddingIndex.putAll(
+            added.filter { it.embedding.isNotEmpty() }.map { it.id to it.embedding }
+        )
+        if (added.isNotEmpty()) modificationCount.incrementAndGet()
+        return results
+    }
+    
     /**
      * 获取记忆节点
      */
     suspend fun getNode(nodeId: String): MemoryNode? {
         return nodes[nodeId]?.accessed()?.also { accessedNode ->
             nodes[nodeId] = accessedNode
+            accessCount.incrementAndGet()
         }
     }
     
+    /**
+     * 获取记忆节点的当前状态，不计入访问统计
+     */
+    fun peekNode(nodeId: String): MemoryNode? = nodes[nodeId]
+    
     /**
      * 添加关系
      */
@@ -48,6 +133,7 @@ class MemoryGraph {
         
         val relationKey = "${relation.fromNodeId}->${relation.toNodeId}-${relation.relationType}"
         val existingRelation = relations[relationKey]
+        modificationCount.incrementAndGet()
         
         return if (existingRelation == null) {
             relations[relationKey] = relation
@@ -69,20 +155,366 @@ class MemoryGraph {
     
     /**
      * 根据内容相似度查找相关节点
+     * 可选地只返回包含全部 [tags] 且内容类型属于 [contentTypes] 的节点
      */
     suspend fun findSimilarNodes(
         queryEmbedding: List<Float>,
         threshold: Float = 0.7f,
+        limit: Int = 10,
+        tags: Set<String> = emptySet(),
+        contentTypes: Set<ContentType> = emptySet()
+    ): List<Pair<MemoryNode, Float>> {
+        val rows = embeddingIndex.rows()
+        if (limit <= 0 || rows.count == 0 || queryEmbedding.size != rows.dimension) return emptyList()
+        val query = EmbeddingIndex.normalize(queryEmbedding)
+        
+        // 带标签的候选节点远少于总数时，直接按行号计算候选节点的相似度而不扫描整个矩阵
+        if (tags.isNotEmpty()) {
+            val candidates = nodesWithTags(tags)
+            if (candidates.size * TAG_CANDIDATE_RATIO < rows.count) {
+                val scored = embeddingIndex.score(candidates, query).mapNotNull { (nodeId, similarity) ->
+                    if (similarity < threshold) return@mapNotNull null
+                    nodes[nodeId]
+                        ?.takeIf { contentTypes.isEmpty() || it.contentType in contentTypes }
+                        ?.let { it to similarity }
+                }
+                return topByScore(scored, limit)
+            }
+        }
+        
+        // 过滤条件只在扫描前判断一次，无过滤条件时逐行只比较相似度
+        val accept: ((MemoryNode) -> Boolean)? = if (tags.isEmpty() && contentTypes.isEmpty()) {
+            null
+        } else {
+            { node -> (contentTypes.isEmpty() || node.contentType in contentTypes) && node.tags.containsAll(tags) }
+        }
+        
+        // 节点较多时将相似度计算拆分到多个线程，各行的评分互不依赖
+        val scored = if (scanParallelism <= 1 || rows.count < PARALLEL_SCAN_THRESHOLD) {
+            scoreRows(rows, query, 0, rows.count, threshold, limit, accept)
+        } else {
+            val chunkSize = (rows.count + scanParallelism - 1) / scanParallelism
+            coroutineScope {
+                (0 until rows.count step chunkSize)
+                    .map { from ->
+                        async(Dispatchers.Default) {
+                            scoreRows(rows, query, from, minOf(from + chunkSize, rows.count), threshold, limit, accept)
+                        }
+                    }
+                    .awaitAll()
+                    .flatten()
+            }
+        }
+        
+        return topByScore(scored, limit)
+    }
+    
+    /**
+     * 批量相似度检索，返回结果与 [queryEmbeddings] 一一对应
+     * 所有查询共享同一份矩阵快照，外层按行遍历，每行向量只读取一次即与全部查询比较
+     * 节点较多时按行拆分到多个线程，各段分别保留前 [limit] 个结果后再合并
+     */
+    suspend fun findSimilarNodesBatch(
+        queryEmbeddings: List<List<Float>>,
+        threshold: Float = 0.7f,
         limit: Int = 10
+    ): List<List<Pair<MemoryNode, Float>>> {
+        val rows = embeddingIndex.rows()
+        val queries = queryEmbeddings.map { embedding ->
+            if (rows.count > 0 && embedding.size == rows.dimension) EmbeddingIndex.normalize(embedding) else null
+        }
+        if (limit <= 0 || queries.all { it == null }) return queries.map { emptyList() }
+        
+        if (scanParallelism <= 1 || rows.count < PARALLEL_SCAN_THRESHOLD) {
+            return scoreRowsBatch(rows, queries, 0, rows.count, threshold, limit)
+        }
+        
+        val chunkSize = (rows.count + scanParallelism - 1) / scanParallelism
+        val chunkResults = coroutineScope {
+            (0 until rows.count step chunkSize)
+                .map { from ->
+                    async(Dispatchers.Default) {
+                        scoreRowsBatch(rows, queries, from, minOf(from + chunkSize, rows.count), threshold, limit)
+                    }
+                }
+                .awaitAll()
+        }
+        return queries.indices.map { q ->
+            topByScore(chunkResults.flatMap { it[q] }, limit)
+        }
+    }
+    
+    /**
+     * 计算向量矩阵中 [from, to) 行与每个查询向量的相似度，按查询分别保留得分最高的 [limit] 个
+     * 为 null 的查询不参与计算，对应结果为空
+     */
+    private fun scoreRowsBatch(
+        rows: EmbeddingIndex.Rows,
+        queries: List<FloatArray?>,
+        from: Int,
+        to: Int,
+        threshold: Float,
+        limit: Int
+    ): List<List<Pair<MemoryNode, Float>>> {
+        val scored = List(queries.size) { TopK<MemoryNode>(limit) }
+        for (row in from until to) {
+            val node = rows.ids[row]?.let { nodes[it] } ?: continue
+            queries.forEachIndexed { q, query ->
+                if (query != null) {
+                    val similarity = rows.cosine(row, query)
+                    if (similarity >= threshold) scored[q].offer(node, similarity)
+                }
+            }
+        }
+        return scored.map { it.toDescendingList() }
+    }
+    
+    /**
+     * 计算向量矩阵中 [from, to) 行与查询向量的相似度
+     * 仅保留达到阈值且通过过滤的节点中得分最高的 [limit] 个
+     */
+    private fun scoreRows(
+        rows: EmbeddingIndex.Rows,
+        query: FloatArray,
+        from: Int,
+        to: Int,
+        threshold: Float,
+        limit: Int,
+        accept: ((MemoryNode) -> Boolean)?
+    ): List<Pair<MemoryNode, Float>> {
+        val result = TopK<MemoryNode>(limit)
+        for (row in from until to) {
+            val similarity = rows.cosine(row, query)
+            if (similarity < threshold || !result.accepts(similarity)) continue
+            val node = rows.ids[row]?.let { nodes[it] } ?: continue
+            if (accept == null || accept(node)) {
+                result.offer(node, similarity)
+            }
+        }
+        return result.toDescendingList()
+    }
+    
+    /**
+     * 通过标签倒排索引求同时带有全部 [tags] 的节点编号，从最小的集合开始求交
+     */
+    private fun nodesWithTags(tags: Set<String>): Set<String> {
+        val postings = tags.map { tagIndex[it] ?: return emptySet() }.sortedBy { it.size }
+        val result = postings.first().toHashSet()
+        postings.drop(1).forEach { result.retainAll(it) }
+        return result
+    }
+    
+    private fun indexTags(node: MemoryNode) {
+        node.tags.forEach { tag ->
+            tagIndex.computeIfAbsent(tag) { ConcurrentHashMap.newKeySet() }.add(node.id)
+        }
+    }
+    
+    private fun unindexTags(node: MemoryNode) {
+        node.tags.forEach { tag ->
+            tagIndex.computeIfPresent(tag) { _, nodeIds ->
+                nodeIds.remove(node.id)
+                nodeIds.ifEmpty { null }
+            }
+        }
+    }
+    
+    /**
+     * 图中是否有可用于相似度检索的嵌入向量
+     */
+    fun hasEmbeddings(): Boolean = embeddingIndex.size > 0
+    
+    /**
+     * 节点是否已有向量（包括通过 [loadEmbeddings] 从文件恢复的向量）
+     * 同步外部数据时可据此跳过已嵌入的节点，避免重复调用嵌入服务
+     */
+    fun hasEmbedding(nodeId: String): Boolean = embeddingIndex.contains(nodeId)
+    
+    /**
+     * 获取尚无向量的节点：既没有自带向量，也没有从文件恢复向量
+     */
+    fun getNodesWithoutEmbedding(): List<MemoryNode> {
+        val index = embeddingIndex
+        return nodes.values.filter { !index.contains(it.id) }
+    }
+    
+    /**
+     * 批量为已有节点写入向量，索引只扩容一次
+     * 不存在的节点、空向量以及被索引拒绝的向量（如维度与已有向量不一致）会被跳过
+     *
+     * @return 实际更新的节点数
+     */
+    suspend fun updateEmbeddings(embeddings: Map<String, List<Float>>): Int {
+        val candidates = embeddings
+            .filter { (nodeId, embedding) -> embedding.isNotEmpty() && nodes.containsKey(nodeId) }
+            .toList()
+        val accepted = embeddingIndex.putAll(candidates)
+        val updated = candidates
+            .filterIndexed { i, _ -> accepted[i] }
+            .count { (nodeId, embedding) ->
+                nodes.computeIfPresent(nodeId) { _, node -> node.copy(embedding = embedding) } != null
+            }
+        if (updated > 0) modificationCount.incrementAndGet()
+        return updated
+    }
+    
+    /**
+     * 根据关键词重合度查找相关节点
+     * 查询词与节点内容、标签的词项编号集合求交，得分为命中查询词的比例
+     */
+    suspend fun findNodesByKeywords(
+        query: String,
+        threshold: Float = 0.0f,
+        limit: Int = 10
+    ): List<Pair<MemoryNode, Float>> {
+        // 得分以查询的全部词项数为分母，未出现过的词项同样计入，结果不受图中历史词项的影响
+        val queryTerms = tokenize(query).distinct()
+        val queryTokens = queryTokenIds(queryTerms)
+        if (limit <= 0 || queryTokens.isEmpty()) return emptyList()
+        
+        val result = TopK<MemoryNode>(limit)
+        for (nodeId in keywordCandidates(queryTokens)) {
+            val tokens = nodeTokens[nodeId] ?: continue
+            val score = countOverlap(queryTokens, tokens).toFloat() / queryTerms.size
+            if (score < threshold || !result.accepts(score)) continue
+            nodes[nodeId]?.let { result.offer(it, score) }
+        }
+        return result.toDescendingList()
+    }
+    
+    /**
+     * 混合检索：向量相似度与 BM25 关键词得分合并
+     * 精确命中查询词的节点即使向量相似度未达到 [threshold] 也能被召回
+     *
+     * [HybridFusion.WEIGHTED]：BM25 得分按本次结果中的最高分归一化到 [0, 1]，向量相似度保持原值，
+     * 最终得分为 (1 - keywordWeight) * 相似度 + keywordWeight * 归一化 BM25
+     * [HybridFusion.RECIPROCAL_RANK]：只看两路结果中的名次，得分为各路 1 / (k + 名次) 之和，
+     * 此时 [keywordWeight] 不起作用
+     */
+    suspend fun findNodesHybrid(
+        query: String,
+        queryEmbedding: List<Float>,
+        threshold: Float = 0.7f,
+        limit: Int = 10,
+        keywordWeight: Float = DEFAULT_KEYWORD_WEIGHT,
+        fusion: HybridFusion = HybridFusion.WEIGHTED
     ): List<Pair<MemoryNode, Float>> {
-        return nodes.values
-            .map { node ->
-                val similarity = cosineSimilarity(queryEmbedding, node.embedding)
-                node to similarity
+        if (limit <= 0) return emptyList()
+        
+        // 两路各多取一些候选，合并后再截取前 limit 个
+        val vectorHits = findSimilarNodes(queryEmbedding, threshold, limit * HYBRID_CANDIDATE_FACTOR)
+        return fuseWithKeywords(query, vectorHits, limit, keywordWeight, fusion)
+    }
+    
+    /**
+     * 批量混合检索，返回结果与 [queries] 一一对应，每个查询的结果与 [findNodesHybrid] 相同
+     * 向量一路共享同一次矩阵扫描（见 [findSimilarNodesBatch]），BM25 按查询分别计算
+     */
+    suspend fun findNodesHybridBatch(
+        queries: List<String>,
+        queryEmbeddings: List<List<Float>>,
+        threshold: Float = 0.7f,
+        limit: Int = 10,
+        keywordWeight: Float = DEFAULT_KEYWORD_WEIGHT,
+        fusion: HybridFusion = HybridFusion.WEIGHTED
+    ): List<List<Pair<MemoryNode, Float>>> {
+        require(queries.size == queryEmbeddings.size) { "Each query needs exactly one embedding" }
+        if (limit <= 0) return queries.map { emptyList() }
+        
+        val vectorHits = findSimilarNodesBatch(queryEmbeddings, threshold, limit * HYBRID_CANDIDATE_FACTOR)
+        return queries.mapIndexed { i, query ->
+            fuseWithKeywords(query, vectorHits[i], limit, keywordWeight, fusion)
+        }
+    }
+    
+    /**
+     * 将已取得的向量检索结果与 [query] 的 BM25 得分合并，合并方式同 [findNodesHybrid]
+     * [vectorHits] 须按相似度降序排列，通常取 limit * [HYBRID_CANDIDATE_FACTOR] 个候选；
+     * 调用方可据此缓存向量一路的结果，而关键词一路总是针对本次查询文本重新计算
+     */
+    fun fuseWithKeywords(
+        query: String,
+        vectorHits: List<Pair<MemoryNode, Float>>,
+        limit: Int = 10,
+        keywordWeight: Float = DEFAULT_KEYWORD_WEIGHT,
+        fusion: HybridFusion = HybridFusion.WEIGHTED
+    ): List<Pair<MemoryNode, Float>> {
+        if (limit <= 0) return emptyList()
+        val keywordHits = scoreBm25(query, limit * HYBRID_CANDIDATE_FACTOR)
+        
+        val fused = HashMap<String, Pair<MemoryNode, Float>>()
+        val accumulate = { node: MemoryNode, score: Float ->
+            fused.merge(node.id, node to score) { existing, _ -> existing.first to existing.second + score }
+        }
+        when (fusion) {
+            HybridFusion.WEIGHTED -> {
+                vectorHits.forEach { (node, similarity) -> accumulate(node, (1 - keywordWeight) * similarity) }
+                val maxKeywordScore = keywordHits.firstOrNull()?.second ?: 0f
+                if (maxKeywordScore > 0f) {
+                    keywordHits.forEach { (node, score) -> accumulate(node, keywordWeight * score / maxKeywordScore) }
+                }
+            }
+            HybridFusion.RECIPROCAL_RANK -> {
+                // 两路结果均已按得分降序排列，下标即名次
+                vectorHits.forEachIndexed { rank, (node, _) -> accumulate(node, 1f / (RRF_K + rank + 1)) }
+                keywordHits.forEachIndexed { rank, (node, _) -> accumulate(node, 1f / (RRF_K + rank + 1)) }
+            }
+        }
+        return topByScore(fused.values, limit)
+    }
+    
+    /**
+     * 计算各节点对查询的 BM25 得分，返回得分最高的 [limit] 个
+     * 节点的词项不重复存储，词频按 1 计，文档长度为节点的词项数
+     */
+    private fun scoreBm25(query: String, limit: Int): List<Pair<MemoryNode, Float>> {
+        val queryTokens = queryTokenIds(tokenize(query))
+        if (limit <= 0 || queryTokens.isEmpty()) return emptyList()
+        
+        // 文档频率取自倒排表长度，平均文档长度由维护的词项总数得出，无需遍历全部节点
+        val documentCount = nodeTokens.size
+        if (documentCount == 0) return emptyList()
+        
+        val averageLength = totalTokenCount.get().toFloat() / documentCount
+        val idf = FloatArray(queryTokens.size) { i ->
+            val df = tokenPostings[queryTokens[i]]?.size ?: 0
+            ln(1f + (documentCount - df + 0.5f) / (df + 0.5f))
+        }
+        
+        // 只为至少命中一个查询词的节点计算得分
+        val result = TopK<MemoryNode>(limit)
+        for (nodeId in keywordCandidates(queryTokens)) {
+            val tokens = nodeTokens[nodeId] ?: continue
+            val lengthNorm = BM25_K1 * (1 - BM25_B + BM25_B * tokens.size / averageLength)
+            var score = 0f
+            forEachShared(queryTokens, tokens) { i ->
+                score += idf[i] * (BM25_K1 + 1) / (1 + lengthNorm)
             }
-            .filter { it.second >= threshold }
-            .sortedByDescending { it.second }
-            .take(limit)
+            if (score > 0f && result.accepts(score)) {
+                nodes[nodeId]?.let { result.offer(it, score) }
+            }
+        }
+        return result.toDescendingList()
+    }
+    
+    /**
+     * 通过倒排表求至少含有一个查询词的节点编号
+     */
+    private fun keywordCandidates(queryTokens: IntArray): Set<String> {
+        val candidates = HashSet<String>()
+        queryTokens.forEach { token -> tokenPostings[token]?.let { candidates.addAll(it) } }
+        return candidates
+    }
+    
+    /**
+     * 将查询词项映射为已知词项的有序编号数组，未出现过的词项直接忽略
+     */
+    private fun queryTokenIds(terms: List<String>): IntArray {
+        return terms
+            .mapNotNull { tokenIds[it] }
+            .distinct()
+            .sorted()
+            .toIntArray()
     }
     
     /**
@@ -125,9 +557,7 @@ class MemoryGraph {
      * 根据重要性和新鲜度获取活跃节点
      */
     suspend fun getActiveNodes(limit: Int = 50): List<MemoryNode> {
-        return nodes.values
-            .sortedByDescending { it.getDecayedImportance() }
-            .take(limit)
+        return rankByDecayedImportance(limit).map { it.first }
     }
     
     /**
@@ -144,10 +574,8 @@ class MemoryGraph {
             .filter { it.getDecayedImportance() < minImportance }
             .map { it.id }
         
-        nodesToRemove.forEach { nodeId ->
-            removeNode(nodeId)
-            cleanedCount++
-        }
+        removeNodes(nodesToRemove)
+        cleanedCount += nodesToRemove.size
         
         // 清理弱关系
         val relationsToRemove = relations.values
@@ -163,20 +591,27 @@ class MemoryGraph {
             cleanedCount++
         }
         
+        if (relationsToRemove.isNotEmpty()) modificationCount.incrementAndGet()
         return cleanedCount
     }
     
     /**
-     * 移除节点及其所有关系
+     * 批量移除节点及其所有关系
+     * 向量一次性从索引中移除，关系只遍历一遍
      */
-    private suspend fun removeNode(nodeId: String) {
-        nodes.remove(nodeId)
-        graph.removeVertex(nodeId)
+    private suspend fun removeNodes(nodeIds: Collection<String>) {
+        if (nodeIds.isEmpty()) return
+        val removed = nodeIds.toHashSet()
+        embeddingIndex.removeAll(removed)
+        removed.forEach { nodeId ->
+            nodes.remove(nodeId)?.let { unindexTags(it) }
+            unindexTokens(nodeId)
+            graph.removeVertex(nodeId)
+        }
         
         // 移除相关的关系
-        relations.keys.removeAll { key ->
-            key.startsWith("$nodeId->") || key.contains("->$nodeId-")
-        }
+        relations.values.removeIf { it.fromNodeId in removed || it.toNodeId in removed }
+        modificationCount.incrementAndGet()
     }
     
     /**
@@ -187,13 +622,21 @@ class MemoryGraph {
             nodeCount = nodes.size,
             relationCount = relations.size,
             averageConnectivity = if (nodes.isEmpty()) 0.0 else relations.size.toDouble() / nodes.size,
-            topNodes = nodes.values
-                .sortedByDescending { it.getDecayedImportance() }
-                .take(5)
-                .map { it.id to it.getDecayedImportance() }
+            topNodes = rankByDecayedImportance(5).map { (node, importance) -> node.id to importance }
         )
     }
     
+    /**
+     * 按衰减重要性取前 [limit] 个节点
+     * 每个节点的衰减重要性只计算一次，且使用同一时间点；只保留前 [limit] 个，不对全部节点排序
+     */
+    private fun rankByDecayedImportance(limit: Int): List<Pair<MemoryNode, Float>> {
+        val now = Instant.now().epochSecond
+        val top = TopK<MemoryNode>(limit)
+        nodes.values.forEach { top.offer(it, it.getDecayedImportance(now)) }
+        return top.toDescendingList()
+    }
+    
     /**
      * 导出节点流
      */
@@ -209,24 +652,166 @@ class MemoryGraph {
     }
     
     /**
-     * 计算余弦相似度
+     * 将所有节点的嵌入向量保存为单个连续文件
      */
-    private fun cosineSimilarity(a: List<Float>, b: List<Float>): Float {
-        if (a.isEmpty() || b.isEmpty() || a.size != b.size) return 0f
+    suspend fun saveEmbeddings(path: Path) {
+        withContext(Dispatchers.IO) { embeddingIndex.save(path) }
+    }
+    
+    /**
+     * 通过内存映射加载嵌入向量文件，须在节点加入图之后调用
+     * 图中已有节点的向量优先于文件中的同名记录（维度与文件不一致时保留文件中的记录）；
+     * 文件中没有对应节点的记录被丢弃，不会计入 [hasEmbeddings] 和相似度扫描
+     */
+    suspend fun loadEmbeddings(path: Path) {
+        val loaded = withContext(Dispatchers.IO) { EmbeddingIndex.load(path) }
+        require(loaded.precision == embeddingPrecision) {
+            "Embedding file precision ${loaded.precision} does not match graph precision $embeddingPrecision"
+        }
+        loaded.removeAll(loaded.ids().filterNot { nodes.containsKey(it) })
+        nodes.values
+            .filter { it.embedding.isNotEmpty() }
+            .forEach { loaded.put(it.id, it.embedding) }
+        embeddingIndex = loaded
+        modificationCount.incrementAndGet()
+    }
+    
+    private fun indexTokens(nodeId: String, tokens: IntArray) {
+        nodeTokens[nodeId] = tokens
+        tokens.forEach { token ->
+            tokenPostings.computeIfAbsent(token) { ConcurrentHashMap.newKeySet() }.add(nodeId)
+        }
+        totalTokenCount.addAndGet(tokens.size.toLong())
+    }
+    
+    private fun unindexTokens(nodeId: String) {
+        val tokens = nodeTokens.remove(nodeId) ?: return
+        tokens.forEach { token ->
+            tokenPostings.computeIfPresent(token) { _, nodeIds ->
+                nodeIds.remove(nodeId)
+                nodeIds.ifEmpty { null }
+            }
+        }
+        totalTokenCount.addAndGet(-tokens.size.toLong())
+    }
+    
+    /**
+     * 将节点内容和标签切分为词项并映射为有序的整数编号数组
+     */
+    private fun internTokens(node: MemoryNode): IntArray {
+        val tokens = tokenize(node.content) + node.tags.map { it.lowercase() }
+        return tokens
+            .map { token -> tokenIds.computeIfAbsent(token) { nextTokenId.getAndIncrement() } }
+            .distinct()
+            .sorted()
+            .toIntArray()
+    }
+    
+    /**
+     * 计算两个有序编号数组的交集大小
+     */
+    private fun countOverlap(a: IntArray, b: IntArray): Int {
+        var count = 0
+        forEachShared(a, b) { count++ }
+        return count
+    }
+    
+    /**
+     * 遍历两个有序编号数组的公共元素，回调参数为该元素在 [a] 中的下标
+     */
+    private inline fun forEachShared(a: IntArray, b: IntArray, action: (Int) -> Unit) {
+        var i = 0
+        var j = 0
+        while (i < a.size && j < b.size) {
+            when {
+                a[i] == b[j] -> { action(i); i++; j++ }
+                a[i] < b[j] -> i++
+                else -> j++
+            }
+        }
+    }
+    
+    companion object {
+        // 超过该节点数时才并行扫描，避免小图上的协程调度开销
+        private const val PARALLEL_SCAN_THRESHOLD = 2048
+        // 带标签的候选节点数乘以该系数仍小于向量总数时，改为只计算候选节点
+        private const val TAG_CANDIDATE_RATIO = 4
+        private val DEFAULT_SCAN_PARALLELISM = Runtime.getRuntime().availableProcessors().coerceIn(1, 8)
         
-        var dotProduct = 0f
-        var normA = 0f
-        var normB = 0f
+        // 混合检索参数：关键词得分权重、每路候选数相对 limit 的倍数，以及 BM25 的标准参数
+        private const val DEFAULT_KEYWORD_WEIGHT = 0.4f
+        internal const val HYBRID_CANDIDATE_FACTOR = 2
+        private const val BM25_K1 = 1.2f
+        private const val BM25_B = 0.75f
+        private const val RRF_K = 60
         
-        for (i in a.indices) {
-            dotProduct += a[i] * b[i]
-            normA += a[i] * a[i]
-            normB += b[i] * b[i]
+        // \p{Punct} 只含 ASCII 标点，另加 Unicode 标点以切开中文的全角标点
+        private val TOKEN_DELIMITER = Regex("[\\s\\p{Punct}\\p{IsPunctuation}]+")
+        // 中日韩文字之间没有空格，连续的一段按字二元组切分
+        private val CJK_RUN = Regex("[\\p{IsHan}\\p{IsHiragana}\\p{IsKatakana}\\p{IsHangul}]+")
+        
+        /**
+         * 从候选中选出得分最高的 [limit] 个并按得分降序返回
+         */
+        private fun <T> topByScore(candidates: Iterable<Pair<T, Float>>, limit: Int): List<Pair<T, Float>> {
+            val top = TopK<T>(limit)
+            candidates.forEach { (item, score) -> top.offer(item, score) }
+            return top.toDescendingList()
         }
         
-        val denominator = kotlin.math.sqrt(normA * normB)
-        return if (denominator == 0f) 0f else dotProduct / denominator
+        /**
+         * 按空白和标点切分为词项；中日韩文字段切分为相邻两字组成的二元组，单字段保留为一个词项
+         */
+        private fun tokenize(text: String): List<String> {
+            val tokens = mutableListOf<String>()
+            text.lowercase().split(TOKEN_DELIMITER).forEach { word ->
+                var start = 0
+                CJK_RUN.findAll(word).forEach { run ->
+                    if (run.range.first > start) tokens.add(word.substring(start, run.range.first))
+                    if (run.value.length == 1) {
+                        tokens.add(run.value)
+                    } else {
+                        run.value.windowed(2).forEach { tokens.add(it) }
+                    }
+                    start = run.range.last + 1
+                }
+                if (start < word.length) tokens.add(word.substring(start))
+            }
+            return tokens
+        }
+    }
+}
+
+/**
+ * 保留得分最高的 [limit] 个元素
+ * 以容量为 [limit] 的小顶堆代替对全部候选排序，选取代价为 O(n log k)
+ */
+private class TopK<T>(private val limit: Int) {
+    
+    private val heap = PriorityQueue<Pair<T, Float>>(compareBy { it.second })
+    
+    /**
+     * 得分为 [score] 的候选能否进入当前结果，用于在构造候选前提前跳过
+     */
+    fun accepts(score: Float): Boolean {
+        return limit > 0 && (heap.size < limit || score > heap.peek().second)
+    }
+    
+    fun offer(item: T, score: Float) {
+        if (!accepts(score)) return
+        if (heap.size == limit) heap.poll()
+        heap.add(item to score)
     }
+    
+    fun toDescendingList(): List<Pair<T, Float>> = heap.sortedByDescending { it.second }
+}
+
+/**
+ * 混合检索中向量与关键词两路结果的合并方式
+ */
+enum class HybridFusion {
+    WEIGHTED,           // 按得分加权求和
+    RECIPROCAL_RANK     // 倒数排名融合（RRF），只依赖名次，不受两路得分尺度差异影响
 }
 
 /**
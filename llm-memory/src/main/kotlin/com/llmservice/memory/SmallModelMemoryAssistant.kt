@@ -1,66 +1,176 @@
 package com.llmservice.memory
 
-import kotlinx.coroutines.flow.Flow
-import kotlinx.coroutines.flow.flow
 import kotlinx.serialization.Serializable
+import java.time.Instant
 
 /**
  * 小参数模型记忆助手
  * 使用轻量级模型来辅助大模型进行记忆管理和检索
+ *
+ * @param contextCacheSize 缓存的记忆上下文条数，0 表示不缓存。
+ * 记忆图内容变化（见 [MemoryGraph.version]）后缓存的上下文自动失效
+ * @param semanticCacheThreshold 语义缓存的余弦相似度阈值，null 表示不启用。
+ * 启用后，查询向量与近期某次查询足够接近时直接复用其向量检索的候选，跳过矩阵扫描；
+ * 混合检索的关键词一路仍按本次查询文本计算，不会沿用其他查询的关键词命中
+ * @param semanticCacheTtlSeconds 语义缓存条目的有效期（秒），0 表示只在记忆图变化时失效
  */
 class SmallModelMemoryAssistant(
     private val memoryGraph: MemoryGraph,
-    private val embeddingService: EmbeddingService
+    private val embeddingService: EmbeddingService,
+    private val contextCacheSize: Int = 256,
+    private val semanticCacheThreshold: Float? = null,
+    private val semanticCacheTtlSeconds: Long = 0
 ) {
     
+    private data class ContextKey(
+        val query: String,
+        val maxContextNodes: Int,
+        val includeRelatedConcepts: Boolean,
+        val mode: RetrievalMode
+    )
+    
+    private class CachedContext(val graphVersion: Long, val accessVersion: Long, val context: MemoryContext)
+    
+    private val contextCache = object : LinkedHashMap<ContextKey, CachedContext>(16, 0.75f, true) {
+        override fun removeEldestEntry(eldest: MutableMap.MutableEntry<ContextKey, CachedContext>?): Boolean {
+            return size > contextCacheSize
+        }
+    }
+    
+    private class SemanticEntry(
+        val queryEmbedding: FloatArray,
+        val graphVersion: Long,
+        val maxContextNodes: Int,
+        val vectorHits: List<Pair<MemoryNode, Float>>,
+        val createdAt: Long
+    )
+    
+    // 近期查询的归一化向量及其向量检索候选，最近使用的在前
+    private val semanticCache = ArrayDeque<SemanticEntry>()
+    
+    // 最近一次生成的报告及生成时的图版本号、访问版本号
+    @Volatile
+    private var cachedReport: Triple<Long, Long, MemoryReport>? = null
+    
     /**
      * 为查询生成记忆上下文
-     * 使用小模型分析查询并检索相关记忆
+     * 使用小模型分析查询并检索相关记忆；记忆图未变化时重复的查询直接返回缓存结果，
+     * 期间节点被访问过时只从图中刷新返回节点的访问统计，检索结果与排序不变
+     *
+     * @param mode 检索方式，默认只按向量相似度检索；[RetrievalMode.HYBRID] 额外合并 BM25 关键词得分
      */
     suspend fun generateMemoryContext(
         query: String,
         maxContextNodes: Int = 10,
-        includeRelatedConcepts: Boolean = true
+        includeRelatedConcepts: Boolean = true,
+        mode: RetrievalMode = RetrievalMode.VECTOR
     ): MemoryContext {
+        val key = ContextKey(query, maxContextNodes, includeRelatedConcepts, mode)
+        // 先读取版本号再检索，检索期间图被修改时缓存的结果会在下次查询时失效
+        val graphVersion = memoryGraph.version
+        val accessVersion = memoryGraph.accessVersion
+        synchronized(contextCache) {
+            contextCache[key]?.takeIf { it.graphVersion == graphVersion }?.let { cached ->
+                if (cached.accessVersion == accessVersion) return cached.context
+                val refreshed = refreshNodes(cached.context)
+                contextCache[key] = CachedContext(graphVersion, accessVersion, refreshed)
+                return refreshed
+            }
+        }
         
-        // 1. 分析查询意图和关键概念
-        val queryAnalysis = analyzeQuery(query)
+        val context = retrieveMemoryContext(query, maxContextNodes, includeRelatedConcepts, mode, graphVersion)
+        if (contextCacheSize > 0) {
+            synchronized(contextCache) { contextCache[key] = CachedContext(graphVersion, accessVersion, context) }
+        }
+        return context
+    }
+    
+    /**
+     * 用图中节点的当前状态替换缓存上下文中的节点，使访问次数和访问时间保持最新
+     */
+    private fun refreshNodes(context: MemoryContext): MemoryContext {
+        return context.copy(
+            primaryMemories = context.primaryMemories.map { memoryGraph.peekNode(it.id) ?: it },
+            relatedMemories = context.relatedMemories.map { memoryGraph.peekNode(it.id) ?: it }
+        )
+    }
+    
+    private suspend fun retrieveMemoryContext(
+        query: String,
+        maxContextNodes: Int,
+        includeRelatedConcepts: Boolean,
+        mode: RetrievalMode,
+        graphVersion: Long
+    ): MemoryContext {
         
-        // 2. 生成查询嵌入
-        val queryEmbedding = embeddingService.generateEmbedding(query)
+        // 1. 分析查询（只做本地的正则切分，直接在当前协程中完成）
+        val queryAnalysis = analyzeQuery(query)
         
-        // 3. 检索相似节点
-        val similarNodes = memoryGraph.findSimilarNodes(
-            queryEmbedding = queryEmbedding,
-            threshold = 0.6f,
-            limit = maxContextNodes
-        )
+        // 2. 生成查询嵌入（图中没有任何向量时无需生成）
+        val queryEmbedding = if (memoryGraph.hasEmbeddings()) {
+            embeddingService.generateEmbedding(query)
+        } else {
+            emptyList()
+        }
         
-        // 4. 如果需要，获取相关概念
-        val relatedNodes = if (includeRelatedConcepts) {
-            val allRelated = mutableSetOf<MemoryNode>()
-            similarNodes.take(3).forEach { (node, _) ->
-                val neighbors = memoryGraph.getNeighbors(
-                    nodeId = node.id,
-                    maxDistance = 2,
-                    minRelationStrength = 0.4f
-                )
-                allRelated.addAll(neighbors)
+        // 3. 检索相似节点（语义相近的查询复用向量候选），没有可用的查询向量时退化为关键词匹配
+        val similarNodes = if (queryEmbedding.isNotEmpty()) {
+            val vectorHits = findVectorCandidates(queryEmbedding, maxContextNodes, graphVersion)
+            when (mode) {
+                RetrievalMode.VECTOR -> vectorHits.take(maxContextNodes)
+                RetrievalMode.HYBRID -> memoryGraph.fuseWithKeywords(query, vectorHits, limit = maxContextNodes)
             }
-            allRelated.toList()
         } else {
-            emptyList()
+            memoryGraph.findNodesByKeywords(query, limit = maxContextNodes)
         }
         
-        // 5. 构建记忆上下文
-        return MemoryContext(
-            query = query,
-            queryAnalysis = queryAnalysis,
-            primaryMemories = similarNodes.map { it.first },
-            relatedMemories = relatedNodes,
-            contextualRelevance = calculateContextualRelevance(similarNodes, relatedNodes),
-            suggestions = generateMemorySuggestions(queryAnalysis, similarNodes)
-        )
+        return buildMemoryContext(query, queryAnalysis, similarNodes, includeRelatedConcepts)
+    }
+    
+    /**
+     * 为多个查询批量生成记忆上下文，结果与 [queries] 一一对应
+     * 查询嵌入通过一次批量调用生成，向量检索共享同一次矩阵扫描，
+     * 每个查询的主要记忆与以相同 [mode] 单独调用 [generateMemoryContext] 时一致
+     */
+    suspend fun generateMemoryContexts(
+        queries: List<String>,
+        maxContextNodes: Int = 10,
+        includeRelatedConcepts: Boolean = true,
+        mode: RetrievalMode = RetrievalMode.VECTOR
+    ): List<MemoryContext> {
+        if (queries.isEmpty()) return emptyList()
+        
+        val queryEmbeddings = if (memoryGraph.hasEmbeddings()) {
+            embeddingService.generateBatchEmbeddings(queries)
+        } else {
+            queries.map { emptyList<Float>() }
+        }
+        require(queryEmbeddings.size == queries.size) {
+            "Embedding service returned ${queryEmbeddings.size} embeddings for ${queries.size} queries"
+        }
+        
+        // 只有生成了向量的查询参与向量或混合检索，其余查询退化为关键词匹配
+        val embedded = queries.indices.filter { queryEmbeddings[it].isNotEmpty() }
+        val retrieved = when (mode) {
+            RetrievalMode.VECTOR -> memoryGraph.findSimilarNodesBatch(
+                queryEmbeddings = embedded.map { queryEmbeddings[it] },
+                threshold = SIMILARITY_THRESHOLD,
+                limit = maxContextNodes
+            )
+            RetrievalMode.HYBRID -> memoryGraph.findNodesHybridBatch(
+                queries = embedded.map { queries[it] },
+                queryEmbeddings = embedded.map { queryEmbeddings[it] },
+                threshold = SIMILARITY_THRESHOLD,
+                limit = maxContextNodes
+            )
+        }
+        val similarByQuery = embedded.zip(retrieved).toMap()
+        
+        return queries.mapIndexed { i, query ->
+            val similarNodes = similarByQuery[i]
+                ?: memoryGraph.findNodesByKeywords(query, limit = maxContextNodes)
+            buildMemoryContext(query, analyzeQuery(query), similarNodes, includeRelatedConcepts)
+        }
     }
     
     /**
@@ -72,12 +182,12 @@ class SmallModelMemoryAssistant(
         context: String? = null
     ): ProcessingResult {
         
-        // 1. 生成内容嵌入
-        val embedding = embeddingService.generateEmbedding(content)
-        
-        // 2. 分析内容以提取关键信息
+        // 1. 分析内容以提取关键信息
         val contentAnalysis = analyzeContent(content, contentType)
         
+        // 2. 生成内容嵌入
+        val embedding = embeddingService.generateEmbedding(content)
+        
         // 3. 检查是否有相似的现有记忆
         val similarMemories = memoryGraph.findSimilarNodes(
             queryEmbedding = embedding,
@@ -95,6 +205,67 @@ class SmallModelMemoryAssistant(
         }
     }
     
+    /**
+     * 批量处理新信息，结果与 [contents] 一一对应
+     * 内容嵌入通过一次批量调用生成，相似记忆检索共享同一次矩阵扫描，新节点一次性写入记忆图
+     * 同一批次内的内容之间不做去重
+     */
+    suspend fun processNewInformationBatch(
+        contents: List<String>,
+        contentType: ContentType = ContentType.TEXT,
+        context: String? = null
+    ): List<ProcessingResult> {
+        if (contents.isEmpty()) return emptyList()
+        
+        val embeddings = embeddingService.generateBatchEmbeddings(contents)
+        require(embeddings.size == contents.size) {
+            "Embedding service returned ${embeddings.size} embeddings for ${contents.size} contents"
+        }
+        val similarByContent = memoryGraph.findSimilarNodesBatch(
+            queryEmbeddings = embeddings,
+            threshold = 0.8f,
+            limit = 1
+        )
+        
+        val newNodes = mutableListOf<MemoryNode>()
+        // 需要新建节点的内容先留空，写入记忆图后再按实际添加结果填入
+        val updates = contents.mapIndexed { i, content ->
+            val analysis = analyzeContent(content, contentType)
+            val mostSimilar = similarByContent[i].firstOrNull()
+            if (mostSimilar != null && mostSimilar.second > 0.9f) {
+                updateExistingMemory(mostSimilar.first, content, analysis)
+            } else {
+                newNodes.add(buildMemoryNode(content, contentType, embeddings[i], analysis, context))
+                null
+            }
+        }
+        
+        val added = memoryGraph.addNodes(newNodes)
+        var next = 0
+        return updates.map { result ->
+            result ?: creationResult(newNodes[next], added[next]).also { next++ }
+        }
+    }
+    
+    /**
+     * 为尚无向量的记忆节点补全嵌入
+     * 缺失向量的节点内容通过一次批量调用生成嵌入，再一次性写入记忆图
+     *
+     * @return 补全向量的节点数
+     */
+    suspend fun backfillEmbeddings(): Int {
+        val missing = memoryGraph.getNodesWithoutEmbedding()
+        if (missing.isEmpty()) return 0
+        
+        val embeddings = embeddingService.generateBatchEmbeddings(missing.map { it.content })
+        require(embeddings.size == missing.size) {
+            "Embedding service returned ${embeddings.size} embeddings for ${missing.size} nodes"
+        }
+        return memoryGraph.updateEmbeddings(
+            missing.zip(embeddings).associate { (node, embedding) -> node.id to embedding }
+        )
+    }
+    
     /**
      * 建议记忆整理策略
      */
@@ -138,12 +309,20 @@ class SmallModelMemoryAssistant(
     
     /**
      * 生成记忆摘要报告
+     * 记忆图内容和节点访问统计都未变化时直接返回上次的报告，不再重新扫描全部节点
+     * 重要性的时间衰减按天计算，不会单独触发重新生成
      */
     suspend fun generateMemoryReport(): MemoryReport {
+        val graphVersion = memoryGraph.version
+        val accessVersion = memoryGraph.accessVersion
+        cachedReport?.let { (cachedVersion, cachedAccessVersion, report) ->
+            if (cachedVersion == graphVersion && cachedAccessVersion == accessVersion) return report
+        }
+        
         val stats = memoryGraph.getStatistics()
         val activeNodes = memoryGraph.getActiveNodes(20)
         
-        return MemoryReport(
+        val report = MemoryReport(
             totalNodes = stats.nodeCount,
             totalRelations = stats.relationCount,
             averageConnectivity = stats.averageConnectivity,
@@ -154,10 +333,104 @@ class SmallModelMemoryAssistant(
             memoryDistribution = analyzeMemoryDistribution(activeNodes),
             healthScore = calculateMemoryHealthScore(stats)
         )
+        cachedReport = Triple(graphVersion, accessVersion, report)
+        return report
     }
     
     // 私有辅助方法
     
+    /**
+     * 向量检索的候选，与 [MemoryGraph.findNodesHybrid] 的向量一路取相同数量，按相似度降序排列
+     * 向量检索取其中前 maxContextNodes 个；启用语义缓存时优先复用相近查询的候选
+     */
+    private suspend fun findVectorCandidates(
+        queryEmbedding: List<Float>,
+        maxContextNodes: Int,
+        graphVersion: Long
+    ): List<Pair<MemoryNode, Float>> {
+        val normalized = EmbeddingIndex.normalize(queryEmbedding)
+        lookupSemanticCache(normalized, maxContextNodes, graphVersion)?.let { return it }
+        return memoryGraph.findSimilarNodes(
+            queryEmbedding = queryEmbedding,
+            threshold = SIMILARITY_THRESHOLD,
+            limit = maxContextNodes * MemoryGraph.HYBRID_CANDIDATE_FACTOR
+        ).also { storeSemanticCache(normalized, maxContextNodes, graphVersion, it) }
+    }
+    
+    /**
+     * 查找与 [queryEmbedding] 足够接近、基于同一图版本且未过期的缓存向量候选
+     */
+    private fun lookupSemanticCache(
+        queryEmbedding: FloatArray,
+        maxContextNodes: Int,
+        graphVersion: Long
+    ): List<Pair<MemoryNode, Float>>? {
+        val threshold = semanticCacheThreshold ?: return null
+        val now = Instant.now().epochSecond
+        synchronized(semanticCache) {
+            semanticCache.removeAll { entry ->
+                entry.graphVersion != graphVersion ||
+                    (semanticCacheTtlSeconds > 0 && now - entry.createdAt > semanticCacheTtlSeconds)
+            }
+            val index = semanticCache.indexOfFirst { entry ->
+                entry.maxContextNodes == maxContextNodes &&
+                    dotProduct(entry.queryEmbedding, queryEmbedding) >= threshold
+            }
+            if (index < 0) return null
+            val entry = semanticCache.removeAt(index)
+            semanticCache.addFirst(entry)
+            return entry.vectorHits
+        }
+    }
+    
+    private fun storeSemanticCache(
+        queryEmbedding: FloatArray,
+        maxContextNodes: Int,
+        graphVersion: Long,
+        vectorHits: List<Pair<MemoryNode, Float>>
+    ) {
+        if (semanticCacheThreshold == null) return
+        val entry = SemanticEntry(queryEmbedding, graphVersion, maxContextNodes, vectorHits, Instant.now().epochSecond)
+        synchronized(semanticCache) {
+            semanticCache.addFirst(entry)
+            while (semanticCache.size > SEMANTIC_CACHE_SIZE) semanticCache.removeLast()
+        }
+    }
+    
+    private suspend fun buildMemoryContext(
+        query: String,
+        queryAnalysis: QueryAnalysis,
+        similarNodes: List<Pair<MemoryNode, Float>>,
+        includeRelatedConcepts: Boolean
+    ): MemoryContext {
+        // 如果需要，获取相关概念
+        val relatedNodes = if (includeRelatedConcepts) {
+            // 按节点编号去重，避免对整个数据类（含内容和向量）求哈希
+            val allRelated = LinkedHashMap<String, MemoryNode>()
+            similarNodes.take(3).forEach { (node, _) ->
+                val neighbors = memoryGraph.getNeighbors(
+                    nodeId = node.id,
+                    maxDistance = 2,
+                    minRelationStrength = 0.4f
+                )
+                neighbors.forEach { allRelated.putIfAbsent(it.id, it) }
+            }
+            allRelated.values.toList()
+        } else {
+            emptyList()
+        }
+        
+        // 构建记忆上下文
+        return MemoryContext(
+            query = query,
+            queryAnalysis = queryAnalysis,
+            primaryMemories = similarNodes.map { it.first },
+            relatedMemories = relatedNodes,
+            contextualRelevance = calculateContextualRelevance(similarNodes, relatedNodes),
+            suggestions = generateMemorySuggestions(queryAnalysis, similarNodes)
+        )
+    }
+    
     private suspend fun analyzeQuery(query: String): QueryAnalysis {
         // 这里可以集成小型NLP模型来分析查询
         // 暂时使用简单的关键词提取
@@ -206,7 +479,27 @@ class SmallModelMemoryAssistant(
         analysis: ContentAnalysis,
         context: String?
     ): ProcessingResult {
-        val newNode = MemoryNode(
+        val newNode = buildMemoryNode(content, contentType, embedding, analysis, context)
+        return creationResult(newNode, memoryGraph.addNode(newNode))
+    }
+    
+    private fun creationResult(node: MemoryNode, success: Boolean): ProcessingResult {
+        return ProcessingResult(
+            success = success,
+            nodeId = node.id,
+            action = ProcessingAction.CREATED,
+            message = if (success) "Created new memory node" else "Failed to create memory node"
+        )
+    }
+    
+    private fun buildMemoryNode(
+        content: String,
+        contentType: ContentType,
+        embedding: List<Float>,
+        analysis: ContentAnalysis,
+        context: String?
+    ): MemoryNode {
+        return MemoryNode(
             content = content,
             contentType = contentType,
             embedding = embedding,
@@ -214,15 +507,6 @@ class SmallModelMemoryAssistant(
             tags = analysis.suggestedTags,
             metadata = context?.let { mapOf("context" to it) } ?: emptyMap()
         )
-        
-        val success = memoryGraph.addNode(newNode)
-        
-        return ProcessingResult(
-            success = success,
-            nodeId = newNode.id,
-            action = ProcessingAction.CREATED,
-            message = if (success) "Created new memory node" else "Failed to create memory node"
-        )
     }
     
     private fun calculateContextualRelevance(
@@ -254,7 +538,7 @@ class SmallModelMemoryAssistant(
     private fun extractKeywords(text: String): List<String> {
         // 简单的关键词提取实现
         return text.lowercase()
-            .split(Regex("[\\s\\p{Punct}]+"))
+            .split(WORD_DELIMITER)
             .filter { it.length > 3 }
             .distinct()
     }
@@ -269,8 +553,8 @@ class SmallModelMemoryAssistant(
     }
     
     private fun calculateComplexity(text: String): Float {
-        val wordCount = text.split(Regex("\\s+")).size
-        val sentenceCount = text.split(Regex("[.!?]+")).size
+        val wordCount = text.split(WHITESPACE).size
+        val sentenceCount = text.split(SENTENCE_DELIMITER).size
         return (wordCount.toFloat() / 20 + sentenceCount.toFloat() / 5).coerceAtMost(1.0f)
     }
     
@@ -294,20 +578,16 @@ class SmallModelMemoryAssistant(
     
     private fun extractCodeConcepts(code: String): List<String> {
         // 提取代码中的类名、函数名等
-        val patterns = listOf(
-            Regex("class\\s+(\\w+)"),
-            Regex("fun\\s+(\\w+)"),
-            Regex("val\\s+(\\w+)"),
-            Regex("var\\s+(\\w+)")
-        )
-        return patterns.flatMap { pattern ->
-            pattern.findAll(code).map { it.groupValues[1] }.toList()
-        }.distinct()
+        return CODE_DECLARATIONS.asSequence()
+            .flatMap { pattern -> pattern.findAll(code) }
+            .map { it.groupValues[1] }
+            .distinct()
+            .toList()
     }
     
     private fun extractConceptualTerms(content: String): List<String> {
         // 提取概念性术语
-        return content.split(Regex("[\\s\\p{Punct}]+"))
+        return content.split(WORD_DELIMITER)
             .filter { it.length > 3 && it[0].isUpperCase() }
             .distinct()
     }
@@ -334,8 +614,8 @@ class SmallModelMemoryAssistant(
     }
     
     private fun analyzeMemoryDistribution(nodes: List<MemoryNode>): Map<ContentType, Int> {
-        return nodes.groupBy { it.contentType }
-            .mapValues { it.value.size }
+        return nodes.groupingBy { it.contentType }
+            .eachCount()
     }
     
     private fun calculateMemoryHealthScore(stats: MemoryGraphStatistics): Float {
@@ -356,6 +636,34 @@ class SmallModelMemoryAssistant(
         
         return score.coerceIn(0.0f, 1.0f)
     }
+    
+    companion object {
+        // 文本切分用的正则只编译一次，避免每次分析都重新构建
+        private val WORD_DELIMITER = Regex("[\\s\\p{Punct}]+")
+        private val WHITESPACE = Regex("\\s+")
+        private val SENTENCE_DELIMITER = Regex("[.!?]+")
+        
+        // 向量检索的相似度阈值，单个与批量查询、两种检索方式共用
+        private const val SIMILARITY_THRESHOLD = 0.6f
+        
+        // 语义缓存每次查找都要与全部条目比较，条目数保持较小
+        private const val SEMANTIC_CACHE_SIZE = 64
+        
+        private fun dotProduct(a: FloatArray, b: FloatArray): Float {
+            if (a.size != b.size) return 0f
+            var sum = 0f
+            for (i in a.indices) sum += a[i] * b[i]
+            return sum
+        }
+        
+        // 代码声明，按 class、fun、val、var 的顺序依次扫描
+        private val CODE_DECLARATIONS = listOf(
+            Regex("class\\s+(\\w+)"),
+            Regex("fun\\s+(\\w+)"),
+            Regex("val\\s+(\\w+)"),
+            Regex("var\\s+(\\w+)")
+        )
+    }
 }
 
 // 数据类定义
@@ -378,6 +686,15 @@ data class QueryAnalysis(
     val intent: String
 )
 
+/**
+ * 生成记忆上下文时的检索方式
+ */
+@Serializable
+enum class RetrievalMode {
+    VECTOR,     // 只按向量相似度检索
+    HYBRID      // 向量相似度与 BM25 关键词得分加权合并（见 MemoryGraph.findNodesHybrid）
+}
+
 @Serializable
 enum class QueryType {
     FACTUAL, PROCEDURAL, CONCEPTUAL, GENERAL
@@ -0,0 +1,67 @@
+package com.llmservice.memory
+
+import kotlinx.coroutines.test.runTest
+import org.junit.jupiter.api.Test
+import org.junit.jupiter.api.Assertions.*
+
+class CachingEmbeddingServiceTest {
+
+    private class CountingEmbeddingService : EmbeddingService {
+        val requestedTexts = mutableListOf<String>()
+
+        override suspend fun generateEmbedding(text: String): List<Float> {
+            requestedTexts.add(text)
+            return listOf(text.length.toFloat(), 1.0f)
+        }
+
+        override suspend fun generateBatchEmbeddings(texts: List<String>): List<List<Float>> {
+            return texts.map { generateEmbedding(it) }
+        }
+    }
+
+    @Test
+    fun `should embed identical text only once`() = runTest {
+        // Given
+        val delegate = CountingEmbeddingService()
+        val service = CachingEmbeddingService(delegate)
+
+        // When
+        val first = service.generateEmbedding("kotlin coroutines")
+        val second = service.generateEmbedding("kotlin coroutines")
+
+        // Then
+        assertEquals(first, second)
+        assertEquals(listOf("kotlin coroutines"), delegate.requestedTexts)
+    }
+
+    @Test
+    fun `should only request missing texts in batch`() = runTest {
+        // Given
+        val delegate = CountingEmbeddingService()
+        val service = CachingEmbeddingService(delegate)
+        service.generateEmbedding("cached")
+
+        // When
+        val results = service.generateBatchEmbeddings(listOf("cached", "new", "new"))
+
+        // Then
+        assertEquals(3, results.size)
+        assertEquals(listOf(3.0f, 1.0f), results[1])
+        assertEquals(listOf("cached", "new"), delegate.requestedTexts)
+    }
+
+    @Test
+    fun `should evict least recently used entries`() = runTest {
+        // Given
+        val delegate = CountingEmbeddingService()
+        val service = CachingEmbeddingService(delegate, maxSize = 1)
+
+        // When
+        service.generateEmbedding("a")
+        service.generateEmbedding("b")
+        service.generateEmbedding("a")
+
+        // Then
+        assertEquals(listOf("a", "b", "a"), delegate.requestedTexts)
+    }
+}
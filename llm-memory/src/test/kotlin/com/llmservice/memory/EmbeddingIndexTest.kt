@@ -0,0 +1,48 @@
+package com.llmservice.memory
+
+import org.junit.jupiter.api.Test
+import org.junit.jupiter.api.Assertions.*
+
+class EmbeddingIndexTest {
+
+    private val query = EmbeddingIndex.normalize(listOf(1.0f, 0.0f))
+
+    @Test
+    fun `should compact rows when removing in bulk`() {
+        // Given
+        val index = EmbeddingIndex()
+        index.putAll((0 until 5).map { "node$it" to listOf(it.toFloat(), 1.0f) })
+
+        // When
+        val removed = index.removeAll(listOf("node1", "node4", "node1", "missing"))
+
+        // Then
+        assertEquals(2, removed)
+        assertEquals(3, index.size)
+        assertFalse(index.contains("node1"))
+        assertFalse(index.contains("node4"))
+        val rows = index.rows()
+        assertEquals(setOf("node0", "node2", "node3"), (0 until rows.count).map { rows.ids[it] }.toSet())
+        assertEquals(listOf("node0", "node2", "node3"), index.score(listOf("node0", "node2", "node3"), query).map { it.first })
+    }
+
+    @Test
+    fun `should keep snapshot unchanged by later writes`() {
+        // Given
+        val index = EmbeddingIndex()
+        index.put("a", listOf(1.0f, 0.0f))
+        index.put("b", listOf(0.0f, 1.0f))
+        val snapshot = index.rows()
+
+        // When
+        index.remove("a")
+        index.put("b", listOf(1.0f, 0.0f))
+
+        // Then
+        assertEquals(2, snapshot.count)
+        assertEquals("a", snapshot.ids[0])
+        assertEquals(1.0f, snapshot.cosine(0, query), 0.001f)
+        assertEquals(0.0f, snapshot.cosine(1, query), 0.001f)
+        assertEquals(1.0f, index.score(listOf("b"), query).single().second, 0.001f)
+    }
+}
@@ -4,6 +4,8 @@ import kotlinx.coroutines.test.runTest
 import org.junit.jupiter.api.Test
 import org.junit.jupiter.api.BeforeEach
 import org.junit.jupiter.api.Assertions.*
+import org.junit.jupiter.api.io.TempDir
+import java.nio.file.Path
 import kotlin.test.assertTrue
 
 class MemoryGraphTest {
@@ -55,6 +57,25 @@ class MemoryGraphTest {
         assertEquals("First node", retrievedNode?.content)
     }
     
+    @Test
+    fun `should add nodes in bulk and skip existing ones`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "existing", content = "Existing node"))
+        val batch = listOf(
+            MemoryNode(id = "existing", content = "Duplicate node"),
+            MemoryNode(id = "new1", content = "New node 1", embedding = listOf(1.0f, 0.0f)),
+            MemoryNode(id = "new2", content = "New node 2", embedding = listOf(0.0f, 1.0f))
+        )
+        
+        // When
+        val added = memoryGraph.addNodes(batch)
+        
+        // Then
+        assertEquals(listOf(false, true, true), added)
+        assertEquals("Existing node", memoryGraph.getNode("existing")?.content)
+        assertEquals("new2", memoryGraph.findSimilarNodes(listOf(0.0f, 1.0f), threshold = 0.5f).first().first.id)
+    }
+    
     @Test
     fun `should add relation between existing nodes`() = runTest {
         // Given
@@ -120,6 +141,284 @@ class MemoryGraphTest {
         assertFalse(similarNodes.any { it.first.id == "node3" })
     }
     
+    @Test
+    fun `should find similar nodes for multiple queries in one batch`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "x", content = "X axis", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "y", content = "Y axis", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        
+        // When
+        val results = memoryGraph.findSimilarNodesBatch(
+            listOf(listOf(0.0f, 1.0f, 0.0f), listOf(1.0f, 0.0f, 0.0f), listOf(1.0f, 0.0f)),
+            threshold = 0.5f
+        )
+        
+        // Then
+        assertEquals(3, results.size)
+        assertEquals(listOf("y"), results[0].map { it.first.id })
+        assertEquals(listOf("x"), results[1].map { it.first.id })
+        assertTrue(results[2].isEmpty())
+    }
+    
+    @Test
+    fun `should filter similar nodes by tags and content type`() = runTest {
+        // Given
+        val embedding = listOf(1.0f, 0.0f, 0.0f)
+        memoryGraph.addNode(MemoryNode(id = "code", content = "Code", contentType = ContentType.CODE, embedding = embedding, tags = setOf("kotlin", "async")))
+        memoryGraph.addNode(MemoryNode(id = "concept", content = "Concept", contentType = ContentType.CONCEPT, embedding = embedding, tags = setOf("kotlin")))
+        memoryGraph.addNode(MemoryNode(id = "other", content = "Other", contentType = ContentType.CODE, embedding = embedding, tags = setOf("python")))
+        
+        // When
+        val byTag = memoryGraph.findSimilarNodes(embedding, threshold = 0.5f, tags = setOf("kotlin"))
+        val byTagAndType = memoryGraph.findSimilarNodes(
+            embedding,
+            threshold = 0.5f,
+            tags = setOf("kotlin"),
+            contentTypes = setOf(ContentType.CODE)
+        )
+        
+        // Then
+        assertEquals(setOf("code", "concept"), byTag.map { it.first.id }.toSet())
+        assertEquals(listOf("code"), byTagAndType.map { it.first.id })
+    }
+    
+    @Test
+    fun `should only score nodes carrying rare tags`() = runTest {
+        // Given
+        val embedding = listOf(1.0f, 0.0f, 0.0f)
+        repeat(10) { i ->
+            memoryGraph.addNode(MemoryNode(id = "common$i", content = "Common $i", embedding = embedding, tags = setOf("python")))
+        }
+        memoryGraph.addNode(MemoryNode(id = "rare", content = "Rare", contentType = ContentType.CODE, embedding = embedding, tags = setOf("python", "rust")))
+        
+        // When
+        val byRareTag = memoryGraph.findSimilarNodes(embedding, threshold = 0.5f, tags = setOf("rust"))
+        val byRareTagAndType = memoryGraph.findSimilarNodes(
+            embedding,
+            threshold = 0.5f,
+            tags = setOf("rust", "python"),
+            contentTypes = setOf(ContentType.CONCEPT)
+        )
+        val byMissingTag = memoryGraph.findSimilarNodes(embedding, threshold = 0.5f, tags = setOf("go"))
+        
+        // Then
+        assertEquals(listOf("rare"), byRareTag.map { it.first.id })
+        assertTrue(byRareTagAndType.isEmpty())
+        assertTrue(byMissingTag.isEmpty())
+    }
+    
+    @Test
+    fun `should restore embeddings from saved file`(@TempDir tempDir: Path) = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Content 1", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "node2", content = "Content 2", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        val file = tempDir.resolve("embeddings.bin")
+        memoryGraph.saveEmbeddings(file)
+        
+        // When
+        val restoredGraph = MemoryGraph()
+        restoredGraph.addNode(MemoryNode(id = "node1", content = "Content 1"))
+        restoredGraph.addNode(MemoryNode(id = "node2", content = "Content 2"))
+        restoredGraph.loadEmbeddings(file)
+        val similarNodes = restoredGraph.findSimilarNodes(listOf(0.0f, 1.0f, 0.0f), threshold = 0.5f)
+        
+        // Then
+        assertTrue(restoredGraph.hasEmbedding("node1"))
+        assertFalse(restoredGraph.hasEmbedding("node3"))
+        assertEquals(1, similarNodes.size)
+        assertEquals("node2", similarNodes.first().first.id)
+    }
+    
+    @Test
+    fun `should drop loaded embeddings of unknown nodes`(@TempDir tempDir: Path) = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Content 1", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "node2", content = "Content 2", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        val file = tempDir.resolve("embeddings.bin")
+        memoryGraph.saveEmbeddings(file)
+        
+        // When
+        val restoredGraph = MemoryGraph()
+        restoredGraph.addNode(MemoryNode(id = "node2", content = "Content 2"))
+        restoredGraph.loadEmbeddings(file)
+        
+        // Then
+        assertTrue(restoredGraph.hasEmbedding("node2"))
+        assertFalse(restoredGraph.hasEmbedding("node1"))
+        assertTrue(restoredGraph.findSimilarNodes(listOf(1.0f, 0.0f, 0.0f), threshold = 0.5f).isEmpty())
+    }
+    
+    @Test
+    fun `should count only embeddings accepted by the index`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "embedded", content = "Content 1", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "valid", content = "Content 2"))
+        memoryGraph.addNode(MemoryNode(id = "mismatched", content = "Content 3"))
+        
+        // When
+        val updated = memoryGraph.updateEmbeddings(
+            mapOf(
+                "valid" to listOf(0.0f, 1.0f, 0.0f),
+                "mismatched" to listOf(0.0f, 1.0f),
+                "missing" to listOf(0.0f, 0.0f, 1.0f)
+            )
+        )
+        
+        // Then
+        assertEquals(1, updated)
+        assertTrue(memoryGraph.hasEmbedding("valid"))
+        assertEquals(listOf("mismatched"), memoryGraph.getNodesWithoutEmbedding().map { it.id })
+        assertEquals(emptyList<Float>(), memoryGraph.getNode("mismatched")?.embedding)
+    }
+    
+    @Test
+    fun `should keep existing embedding when update has mismatched dimension`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Content 1", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        val version = memoryGraph.version
+        
+        // When
+        val updated = memoryGraph.updateEmbeddings(mapOf("node1" to listOf(0.0f, 1.0f)))
+        
+        // Then
+        assertEquals(0, updated)
+        assertEquals(version, memoryGraph.version)
+        assertTrue(memoryGraph.hasEmbedding("node1"))
+        assertEquals(listOf("node1"), memoryGraph.findSimilarNodes(listOf(1.0f, 0.0f, 0.0f)).map { it.first.id })
+    }
+    
+    @Test
+    fun `should find similar nodes with int8 embeddings`() = runTest {
+        // Given
+        val quantizedGraph = MemoryGraph(embeddingPrecision = EmbeddingPrecision.INT8)
+        quantizedGraph.addNode(MemoryNode(id = "node1", content = "Content 1", embedding = listOf(0.9f, 0.1f, 0.0f)))
+        quantizedGraph.addNode(MemoryNode(id = "node2", content = "Content 2", embedding = listOf(0.1f, 0.9f, 0.0f)))
+        
+        // When
+        val similarNodes = quantizedGraph.findSimilarNodes(listOf(1.0f, 0.0f, 0.0f), threshold = 0.9f)
+        
+        // Then
+        assertEquals(listOf("node1"), similarNodes.map { it.first.id })
+        assertEquals(0.994f, similarNodes.first().second, 0.01f)
+    }
+    
+    @Test
+    fun `should restore float16 embeddings from saved file`(@TempDir tempDir: Path) = runTest {
+        // Given
+        val halfGraph = MemoryGraph(embeddingPrecision = EmbeddingPrecision.FLOAT16)
+        halfGraph.addNode(MemoryNode(id = "node1", content = "Content 1", embedding = listOf(0.9f, 0.1f, 0.0f)))
+        halfGraph.addNode(MemoryNode(id = "node2", content = "Content 2", embedding = listOf(0.1f, 0.9f, 0.0f)))
+        val file = tempDir.resolve("embeddings-f16.bin")
+        halfGraph.saveEmbeddings(file)
+        
+        // When
+        val restoredGraph = MemoryGraph(embeddingPrecision = EmbeddingPrecision.FLOAT16)
+        restoredGraph.addNode(MemoryNode(id = "node1", content = "Content 1"))
+        restoredGraph.addNode(MemoryNode(id = "node2", content = "Content 2"))
+        restoredGraph.loadEmbeddings(file)
+        val similarNodes = restoredGraph.findSimilarNodes(listOf(1.0f, 0.0f, 0.0f), threshold = 0.9f)
+        
+        // Then
+        assertEquals(listOf("node1"), similarNodes.map { it.first.id })
+        assertEquals(0.994f, similarNodes.first().second, 0.001f)
+    }
+    
+    @Test
+    fun `should find nodes by keyword overlap`() = runTest {
+        // Given
+        val node1 = MemoryNode(id = "node1", content = "Kotlin coroutines make async code simple", tags = setOf("kotlin"))
+        val node2 = MemoryNode(id = "node2", content = "Kotlin data classes generate equals")
+        val node3 = MemoryNode(id = "node3", content = "Python decorators wrap functions")
+        
+        memoryGraph.addNode(node1)
+        memoryGraph.addNode(node2)
+        memoryGraph.addNode(node3)
+        
+        // When
+        val results = memoryGraph.findNodesByKeywords("kotlin coroutines")
+        
+        // Then
+        assertEquals(2, results.size)
+        assertEquals("node1", results.first().first.id)
+        assertEquals(1.0f, results.first().second)
+        assertFalse(results.any { it.first.id == "node3" })
+    }
+    
+    @Test
+    fun `should not find removed nodes by keywords`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "keep", content = "Kotlin flows", importance = 0.9f))
+        memoryGraph.addNode(MemoryNode(id = "drop", content = "Kotlin channels", importance = 0.05f))
+        memoryGraph.cleanup(minImportance = 0.1f)
+        
+        val freshGraph = MemoryGraph()
+        freshGraph.addNode(MemoryNode(id = "keep", content = "Kotlin flows"))
+        
+        // When
+        val results = memoryGraph.findNodesByKeywords("kotlin channels")
+        val freshResults = freshGraph.findNodesByKeywords("kotlin channels")
+        
+        // Then
+        assertEquals(listOf("keep"), results.map { it.first.id })
+        // 只命中一半查询词，与图中是否出现过 channels 无关
+        assertEquals(0.5f, results.first().second)
+        assertEquals(0.5f, freshResults.first().second)
+    }
+    
+    @Test
+    fun `should recall exact keyword matches in hybrid search`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "semantic", content = "Async programming model", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "keyword", content = "Kotlin decorators explained", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "unrelated", content = "Gardening tips", embedding = listOf(0.0f, 0.0f, 1.0f)))
+        
+        // When
+        val vectorOnly = memoryGraph.findSimilarNodes(listOf(1.0f, 0.0f, 0.0f), threshold = 0.5f)
+        val hybrid = memoryGraph.findNodesHybrid("decorators", listOf(1.0f, 0.0f, 0.0f), threshold = 0.5f)
+        
+        // Then
+        assertEquals(listOf("semantic"), vectorOnly.map { it.first.id })
+        assertEquals(listOf("semantic", "keyword"), hybrid.map { it.first.id })
+        assertEquals(0.6f, hybrid[0].second, 0.001f)
+        assertEquals(0.4f, hybrid[1].second, 0.001f)
+    }
+    
+    @Test
+    fun `should match chinese keywords`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "coroutines", content = "Kotlin 协程让异步代码更简单", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "decorators", content = "Python 装饰器可以包装函数。", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        
+        // When
+        val keywordResults = memoryGraph.findNodesByKeywords("协程")
+        val hybrid = memoryGraph.findNodesHybrid("装饰器怎么用？", listOf(1.0f, 0.0f, 0.0f), threshold = 0.5f)
+        
+        // Then
+        assertEquals(listOf("coroutines"), keywordResults.map { it.first.id })
+        assertEquals(1.0f, keywordResults.first().second)
+        assertEquals(listOf("coroutines", "decorators"), hybrid.map { it.first.id })
+    }
+    
+    @Test
+    fun `should rank nodes found by both searches first with reciprocal rank fusion`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "both", content = "Kotlin decorators", embedding = listOf(0.9f, 0.1f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "vector", content = "Async programming", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "keyword", content = "Python decorators", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        
+        // When
+        val results = memoryGraph.findNodesHybrid(
+            query = "decorators",
+            queryEmbedding = listOf(1.0f, 0.0f, 0.0f),
+            threshold = 0.5f,
+            fusion = HybridFusion.RECIPROCAL_RANK
+        )
+        
+        // Then
+        assertEquals("both", results.first().first.id)
+        assertEquals(setOf("both", "vector", "keyword"), results.map { it.first.id }.toSet())
+    }
+    
     @Test
     fun `should get neighbors within distance`() = runTest {
         // Given
@@ -0,0 +1,179 @@
+package com.llmservice.memory
+
+import kotlinx.coroutines.test.runTest
+import org.junit.jupiter.api.BeforeEach
+import org.junit.jupiter.api.Test
+import org.junit.jupiter.api.Assertions.*
+
+class SmallModelMemoryAssistantTest {
+    
+    private class CountingEmbeddingService : EmbeddingService {
+        var calls = 0
+        var batchCalls = 0
+        
+        override suspend fun generateEmbedding(text: String): List<Float> {
+            calls++
+            return listOf(1.0f, 0.0f, 0.0f)
+        }
+        
+        override suspend fun generateBatchEmbeddings(texts: List<String>): List<List<Float>> {
+            batchCalls++
+            return texts.map { listOf(1.0f, 0.0f, 0.0f) }
+        }
+    }
+    
+    private lateinit var memoryGraph: MemoryGraph
+    private lateinit var embeddingService: CountingEmbeddingService
+    private lateinit var assistant: SmallModelMemoryAssistant
+    
+    @BeforeEach
+    fun setUp() {
+        memoryGraph = MemoryGraph()
+        embeddingService = CountingEmbeddingService()
+        assistant = SmallModelMemoryAssistant(memoryGraph, embeddingService)
+    }
+    
+    @Test
+    fun `should reuse cached context while graph is unchanged`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Kotlin coroutines", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        
+        // When
+        val first = assistant.generateMemoryContext("kotlin coroutines")
+        val second = assistant.generateMemoryContext("kotlin coroutines")
+        
+        // Then
+        assertSame(first, second)
+        assertEquals(1, embeddingService.calls)
+    }
+    
+    @Test
+    fun `should refresh access statistics of cached context nodes`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Kotlin coroutines", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        val first = assistant.generateMemoryContext("kotlin coroutines")
+        
+        // When
+        memoryGraph.getNode("node1")
+        val second = assistant.generateMemoryContext("kotlin coroutines")
+        
+        // Then
+        assertEquals(1, embeddingService.calls)
+        assertEquals(0, first.primaryMemories.single().accessCount)
+        assertEquals(1, second.primaryMemories.single().accessCount)
+    }
+    
+    @Test
+    fun `should invalidate cached context after graph changes`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Kotlin coroutines", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        assistant.generateMemoryContext("kotlin coroutines")
+        
+        // When
+        memoryGraph.addNode(MemoryNode(id = "node2", content = "Kotlin flows", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        val context = assistant.generateMemoryContext("kotlin coroutines")
+        
+        // Then
+        assertEquals(2, embeddingService.calls)
+        assertEquals(setOf("node1", "node2"), context.primaryMemories.map { it.id }.toSet())
+    }
+    
+    @Test
+    fun `should retrieve the same memories in batch as for single queries`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "semantic", content = "Async programming", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "keyword", content = "Python decorators", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        val queries = listOf("decorators", "async programming")
+        
+        // When
+        val vectorBatch = assistant.generateMemoryContexts(queries)
+        val vectorSingle = queries.map { assistant.generateMemoryContext(it) }
+        val hybridBatch = assistant.generateMemoryContexts(queries, mode = RetrievalMode.HYBRID)
+        val hybridSingle = queries.map { assistant.generateMemoryContext(it, mode = RetrievalMode.HYBRID) }
+        
+        // Then
+        assertEquals(listOf("semantic"), vectorBatch[0].primaryMemories.map { it.id })
+        assertEquals(listOf("semantic", "keyword"), hybridBatch[0].primaryMemories.map { it.id })
+        assertEquals(vectorSingle.map { it.primaryMemories }, vectorBatch.map { it.primaryMemories })
+        assertEquals(hybridSingle.map { it.primaryMemories }, hybridBatch.map { it.primaryMemories })
+    }
+    
+    @Test
+    fun `should report each created node from batch processing`() = runTest {
+        // When
+        val results = assistant.processNewInformationBatch(listOf("Kotlin coroutines", "Kotlin flows"))
+        
+        // Then
+        assertEquals(2, results.size)
+        results.forEach { result ->
+            assertTrue(result.success)
+            assertEquals(ProcessingAction.CREATED, result.action)
+            assertNotNull(memoryGraph.getNode(result.nodeId))
+        }
+    }
+    
+    @Test
+    fun `should not treat a repeated keyword as a declared name`() = runTest {
+        // When
+        val result = assistant.processNewInformation("val val x", ContentType.CODE)
+        
+        // Then
+        assertEquals(setOf("val"), memoryGraph.getNode(result.nodeId)?.tags)
+    }
+    
+    @Test
+    fun `should backfill missing embeddings in one batch`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "embedded", content = "Kotlin coroutines", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "missing1", content = "Kotlin flows"))
+        memoryGraph.addNode(MemoryNode(id = "missing2", content = "Kotlin channels"))
+        
+        // When
+        val backfilled = assistant.backfillEmbeddings()
+        
+        // Then
+        assertEquals(2, backfilled)
+        assertEquals(1, embeddingService.batchCalls)
+        assertEquals(0, embeddingService.calls)
+        assertTrue(memoryGraph.getNodesWithoutEmbedding().isEmpty())
+        assertEquals(0, assistant.backfillEmbeddings())
+    }
+    
+    @Test
+    fun `should regenerate memory report only after graph changes`() = runTest {
+        // Given
+        memoryGraph.addNode(MemoryNode(id = "node1", content = "Kotlin coroutines"))
+        val first = assistant.generateMemoryReport()
+        
+        // When
+        val unchanged = assistant.generateMemoryReport()
+        memoryGraph.addNode(MemoryNode(id = "node2", content = "Kotlin flows"))
+        val changed = assistant.generateMemoryReport()
+        
+        // Then
+        assertSame(first, unchanged)
+        assertEquals(1, first.totalNodes)
+        assertEquals(2, changed.totalNodes)
+    }
+    
+    @Test
+    fun `should reuse vector candidates but not keyword hits for semantically similar queries`() = runTest {
+        // Given
+        val cachingAssistant = SmallModelMemoryAssistant(memoryGraph, embeddingService, semanticCacheThreshold = 0.95f)
+        memoryGraph.addNode(MemoryNode(id = "semantic", content = "Async programming", embedding = listOf(1.0f, 0.0f, 0.0f)))
+        memoryGraph.addNode(MemoryNode(id = "keyword", content = "Python decorators", embedding = listOf(0.0f, 1.0f, 0.0f)))
+        
+        // When
+        val first = cachingAssistant.generateMemoryContext("decorators", mode = RetrievalMode.HYBRID)
+        // 访问节点只改变访问统计，不改变图版本号，缓存的候选仍是访问前的节点
+        memoryGraph.getNode("semantic")
+        val paraphrase = cachingAssistant.generateMemoryContext("something else entirely", mode = RetrievalMode.HYBRID)
+        val uncached = assistant.generateMemoryContext("something else entirely", mode = RetrievalMode.HYBRID)
+        
+        // Then
+        assertEquals(listOf("semantic", "keyword"), first.primaryMemories.map { it.id })
+        assertEquals(listOf("semantic"), paraphrase.primaryMemories.map { it.id })
+        assertEquals(0, paraphrase.primaryMemories.first().accessCount)
+        assertEquals(1, uncached.primaryMemories.first().accessCount)
+    }
+}